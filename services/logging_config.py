@@ -151,8 +151,14 @@ def log_image_operation(operation: str, details: str = ""):
         message += f": {details}"
     image_logger.info(message)
 
-def log_provider_message(provider: str, message: str, level: str = "INFO"):
-    """记录Provider特定的消息"""
+def log_provider_message(provider: str, message: str, level: str = "INFO", *args):
+    """
+    记录Provider特定的消息
+
+    支持惰性格式化：message 可包含 %s 占位符，args 中的可调用对象
+    仅在对应日志级别启用时才会被求值，避免为被过滤掉的日志
+    做昂贵的序列化/截断工作
+    """
     logger_map = {
         'google': google_logger,
         'openrouter': openrouter_logger,
@@ -160,6 +166,13 @@ def log_provider_message(provider: str, message: str, level: str = "INFO"):
     }
 
     logger = logger_map.get(provider.lower(), api_logger)
+    level_no = getattr(logging, level.upper(), logging.INFO)
+    if not logger.isEnabledFor(level_no):
+        return
+
+    if args:
+        message = message % tuple(arg() if callable(arg) else arg for arg in args)
+
     log_method = getattr(logger, level.lower(), logger.info)
     log_method(message)
 
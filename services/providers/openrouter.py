@@ -1,15 +1,158 @@
 import os
+import asyncio
 import base64
+from collections import deque
 import json
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-import time
 from typing import Optional
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from .base import ImageProvider
-from ..retry_utils import common_retry_strategy
+from ..retry_utils import common_retry_strategy, common_async_retry_strategy
 from ..logging_config import log_provider_message, log_api_call, log_error, log_image_operation
 
+# HTTP/2 多路复用需要可选依赖 h2；未安装时自动回退 HTTP/1.1
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# SIMD 加速的 base64 编解码（libbase64: AVX2/AVX-512/NEON），
+# 对多 MB 图片有 6-15 倍吞吐提升；未安装时回退标准库
+try:
+    import pybase64 as _b64
+except ImportError:
+    _b64 = base64
+
+# SIMD 扫描的 JSON 解析（orjson），对含大段 base64 的响应体有 2-5 倍吞吐；
+# 未安装时回退标准库。orjson 的解析异常是 ValueError 子类，
+# 调用方统一按 (json.JSONDecodeError, ValueError) 捕获
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# base64 字符集预检正则：一次 C 级扫描即可同时完成合法性校验与 padding 归一化，
+# 避免对明显不是 base64 的长字符串走完整解码 + 异常路径
+_B64_BODY_RE = re.compile(r'[A-Za-z0-9+/]+={0,2}')
+
+# Deep Search 使用的正则，模块加载时编译一次，避免热路径上的 re 缓存查找
+_DATA_URL_RE = re.compile(r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)')
+_IMAGE_EXT_RE = re.compile(r'\.(png|jpg|jpeg|webp|gif)($|\?)', re.IGNORECASE)
+
+# 图片文件头魔数（大端 4 字节前缀整数）
+_PNG_MAGIC = 0x89504E47   # \x89PNG
+_RIFF_MAGIC = 0x52494646  # RIFF（WEBP 容器）
+_GIF_MAGIC = 0x47494638   # GIF8
+
+# Deep Search 黑名单：这些字段不可能包含图片数据，遍历时直接剪枝
+# Deep Search 逐节点日志默认关闭：一次搜索可能访问上千节点，
+# 每条日志的格式化 + 锁开销会超过遍历本身。排查提取问题时
+# 设置环境变量 OPENROUTER_DEEP_SEARCH_DEBUG=1 开启
+_DEEP_SEARCH_DEBUG = os.getenv('OPENROUTER_DEEP_SEARCH_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Deep Search dict 分支中已单独处理的优先级字段，通用遍历时跳过
+_PRIORITY_KEYS = frozenset({'images', 'tool_calls', 'b64_json', 'url'})
+
+_BLACKLIST_KEYS = frozenset({
+    'reasoning', 'reasoning_details',
+    'usage', 'prompt_tokens_details',
+    'annotations'
+})
+
+
+# message.content 的图片候选提取：一次扫描同时匹配三种文本格式
+# （Markdown 图片链接 / data URL / 纯图片 URL），
+# 取代原先每个阶段各自从头重扫整个 content 的瀑布流式写法
+_CONTENT_CANDIDATE_RE = re.compile(
+    r'!\[.*?\]\((?P<md_url>https?://[^\s)]+)\)'
+    r'|data:image/[^;]+;base64,(?P<b64>[A-Za-z0-9+/=]+)'
+    r'|(?P<url>https?://[^\s]*\.(?:png|jpg|jpeg|webp|gif)(?:\?[^\s]*)?)',
+    re.IGNORECASE
+)
+
+
+def _iter_image_candidates(content: str):
+    """单遍扫描 content，按出现顺序产出 (候选类型, 候选内容) 元组"""
+    for match in _CONTENT_CANDIDATE_RE.finditer(content):
+        kind = match.lastgroup
+        yield kind, match.group(kind)
+
+
+def _sniff_mime(data: bytes) -> str:
+    """
+    通过文件头魔数嗅探图片 MIME 类型
+
+    与 _is_valid_image 相同的魔数判定逻辑；无法识别时回退 image/jpeg
+    （与旧版硬编码行为一致）。每张输入图片只嗅探一次
+    """
+    if len(data) >= 4:
+        if data[0] == 0xFF and data[1] == 0xD8 and data[2] == 0xFF:
+            return 'image/jpeg'
+        prefix = int.from_bytes(data[:4], 'big')
+        if prefix == _PNG_MAGIC:
+            return 'image/png'
+        if prefix == _RIFF_MAGIC:
+            return 'image/webp'
+        if prefix == _GIF_MAGIC:
+            return 'image/gif'
+    return 'image/jpeg'
+
+
+def _make_data_url(img_data: bytes) -> str:
+    """
+    把图片字节编码为 data URL 字符串（MIME 按魔数嗅探，不再硬编码 jpeg）
+
+    pybase64 可用时用 b64encode_as_string 直接产出 str
+    （libbase64 一次分配，省去 bytes->str 解码的中间拷贝）；
+    否则在 bytes 层拼接前缀后只做一次 ascii 解码
+    """
+    prefix = 'data:' + _sniff_mime(img_data) + ';base64,'
+    if _b64 is not base64:
+        return prefix + _b64.b64encode_as_string(img_data)
+    return (prefix.encode('ascii') + _b64.b64encode(img_data)).decode('ascii')
+
+
+# 各图片格式文件头魔数对应的 base64 前缀（PNG/JPEG/GIF/WEBP）：
+# base64 前缀与原始字节前缀一一对应，O(1) 的 startswith 即可判定
+# 一个候选串是否可能解码出合法图片，省去整串解码 + 魔数校验
+_B64_IMAGE_PREFIXES = ('iVBORw0K', '/9j/', 'R0lGOD', 'UklGR')
+
+
+def _looks_like_base64_image(data_str: str) -> bool:
+    """
+    O(1) 预筛：候选字符串是否可能是图片的 raw base64
+
+    先用长度模 4 排除不可能的长度（合法 base64 去 padding 后
+    len % 4 != 1），再用已知图片格式的 base64 前缀做前缀匹配
+    """
+    return len(data_str) % 4 != 1 and data_str.startswith(_B64_IMAGE_PREFIXES)
+
+
+# 一次 C 级扫描删除 base64 中的内嵌空白（MIME 折行的 \n 等），
+# 供 _safe_base64_decode 在预检失败时做第二次机会清洗
+_WS_DELETE_TABLE = str.maketrans('', '', ' \t\n\r\x0b\x0c')
+
+
+def _b64_precheck(data_str: str) -> tuple[bool, int]:
+    """
+    单遍扫描 base64 候选字符串
+
+    Args:
+        data_str: 已去除首尾空白的候选字符串
+
+    Returns:
+        tuple[bool, int]: (字符集是否合法, 需要补齐的 padding 数量)
+    """
+    if not data_str or _B64_BODY_RE.fullmatch(data_str) is None:
+        return False, 0
+    return True, -len(data_str) % 4
+
 
 class OpenRouterProvider(ImageProvider):
     def __init__(self, api_key: str):
@@ -18,7 +161,8 @@ class OpenRouterProvider(ImageProvider):
         referer = os.getenv('OPENROUTER_REFERER', 'http://localhost:5000')
         title = os.getenv('OPENROUTER_TITLE', 'Image CHAT')
 
-        self.client = OpenAI(
+        # 同步/异步客户端共用的构造参数
+        self._client_kwargs = dict(
             base_url="https://openrouter.ai/api/v1",
             api_key=api_key,
             default_headers={
@@ -26,39 +170,38 @@ class OpenRouterProvider(ImageProvider):
                 "X-Title": title
             }
         )
+        self.client = OpenAI(**self._client_kwargs)
+
+        # 图片下载复用连接池：同一响应里的多个 URL 不再各自做 TCP+TLS 握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.3,
+                              status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     def generate(self, prompt: str, images: list, temperature: float, model: str, image_count: int, **kwargs) -> list[bytes]:
-        """使用OpenRouter生成图像（批量，兼容旧接口）"""
+        """使用OpenRouter并发生成图像（批量，兼容旧接口）"""
         log_provider_message(
             'openrouter',
             f"开始批量生成: prompt长度={len(prompt)}, 输入图片数量={len(images)}, "
             f"生成数量={image_count}, temperature={temperature}"
         )
 
-        generated_images = []
-
-        for i in range(image_count):
-            log_provider_message('openrouter', f"生成第 {i+1}/{image_count} 张图片")
-
-            try:
-                image_bytes = self.generate_single(
-                    prompt=prompt,
-                    images=images,
-                    temperature=temperature,
-                    model=model,
-                    **kwargs
-                )
-                generated_images.append(image_bytes)
-                log_image_operation("图片生成成功", f"第{i+1}张: {len(image_bytes)}字节")
-
-            except Exception as e:
-                log_error('单张图片生成失败', str(e), f"第{i+1}张图片")
-                continue  # 跳过失败，继续下一张
-
-            # 速率限制：避免触发 OpenRouter 的频率限制
-            if i < image_count - 1:
-                log_provider_message('openrouter', "延迟0.5秒避免频率限制")
-                time.sleep(0.5)
+        # 网络等待占主导，改为 asyncio 并发：总耗时从 N×单次延迟 降为 ~1×单次延迟
+        generated_images = asyncio.run(
+            self._generate_batch_async(
+                prompt=prompt,
+                images=images,
+                temperature=temperature,
+                model=model,
+                image_count=image_count,
+                **kwargs
+            )
+        )
 
         # 检查是否所有图片都失败
         if not generated_images:
@@ -69,6 +212,79 @@ class OpenRouterProvider(ImageProvider):
         log_provider_message('openrouter', f"批量生成完成: 成功生成 {len(generated_images)} 张图片")
         return generated_images
 
+    async def _generate_batch_async(self, prompt: str, images: list, temperature: float,
+                                    model: str, image_count: int, **kwargs) -> list[bytes]:
+        """并发生成多张图片（asyncio + AsyncOpenAI），失败的任务跳过不中断整体"""
+        # 并发上限可通过环境变量配置；429 由重试装饰器指数退避处理，
+        # 不再用固定的 time.sleep(0.5) 串行限速
+        max_concurrency = int(os.getenv('OPENROUTER_CONCURRENCY', '4'))
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        # 输入图片 base64 编码一次，image_count 个并发请求共享同一份消息段
+        image_parts = self._build_image_parts(images)
+
+        # 共享连接池 + HTTP/2（可用时）：并发请求复用同一条连接多路复用，
+        # 省去每个请求的 TCP/TLS 握手开销
+        http_client = httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+        )
+
+        async with AsyncOpenAI(http_client=http_client, **self._client_kwargs) as aclient:
+
+            async def _generate_one(i: int):
+                async with semaphore:
+                    log_provider_message('openrouter', f"生成第 {i+1}/{image_count} 张图片")
+                    try:
+                        image_bytes = await self._generate_single_async(
+                            aclient,
+                            prompt=prompt,
+                            images=images,
+                            temperature=temperature,
+                            model=model,
+                            image_parts=image_parts,
+                            **kwargs
+                        )
+                        log_image_operation("图片生成成功", f"第{i+1}张: {len(image_bytes)}字节")
+                        return image_bytes
+                    except Exception as e:
+                        log_error('单张图片生成失败', str(e), f"第{i+1}张图片")
+                        return None  # 跳过失败，继续其他任务
+
+            results = await asyncio.gather(
+                *[_generate_one(i) for i in range(image_count)]
+            )
+
+        return [r for r in results if r is not None]
+
+    @common_async_retry_strategy
+    async def _generate_single_async(self, aclient: AsyncOpenAI, prompt: str, images: list,
+                                     temperature: float, model: str,
+                                     image_parts: Optional[list] = None, **kwargs) -> bytes:
+        """generate_single 的异步版本（带重试保护），供并发批量路径使用"""
+        log_provider_message(
+            'openrouter',
+            f"_generate_single_async: model={model}, temperature={temperature}, 输入图片={len(images)}"
+        )
+
+        content = self._build_request_content(prompt, images, image_parts)
+
+        log_api_call('openrouter', 'generate_single API调用', f"模型: {model}")
+
+        try:
+            response = await aclient.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": content}],
+                temperature=temperature,
+                extra_body={"modalities": ["image", "text"]}
+            )
+            log_api_call('openrouter', 'API调用成功', f"响应类型: {type(response)}")
+        except Exception as e:
+            log_error('OpenRouter API错误', str(e), f"模型: {model}")
+            raise  # 重新抛出，让重试装饰器处理
+
+        return self._handle_response(response)
+
     @common_retry_strategy
     def generate_single(self, prompt: str, images: list, temperature: float, model: str, image: Optional[bytes] = None, **kwargs) -> bytes:
         """
@@ -94,20 +310,7 @@ class OpenRouterProvider(ImageProvider):
             f"generate_single: model={model}, temperature={temperature}, 输入图片={len(images)}"
         )
 
-        # 构建消息内容
-        content = [{"type": "text", "text": prompt}]
-
-        # 如果有上传的图片，添加到消息中
-        if images:
-            for j, img_data in enumerate(images):
-                if isinstance(img_data, bytes):
-                    # 将二进制图片数据转换为base64
-                    img_b64 = base64.b64encode(img_data).decode('utf-8')
-                    content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}
-                    })
-                    log_image_operation("转换输入图片", f"第{j+1}张: {len(img_data)}字节 -> base64")
+        content = self._build_request_content(prompt, images)
 
         # 调用 OpenAI SDK（会自动重试）
         log_api_call('openrouter', 'generate_single API调用', f"模型: {model}")
@@ -124,8 +327,39 @@ class OpenRouterProvider(ImageProvider):
             log_error('OpenRouter API错误', str(e), f"模型: {model}")
             raise  # 重新抛出，让重试装饰器处理
 
-        # 输出响应日志
-        log_provider_message('openrouter', f"响应: {self._truncate_logs(response.model_dump())}")
+        return self._handle_response(response)
+
+    def _build_image_parts(self, images: list) -> list:
+        """把输入图片编码为 image_url 消息段（每张图片只做一次 base64 编码）"""
+        image_parts = []
+        if images:
+            for j, img_data in enumerate(images):
+                if isinstance(img_data, bytes):
+                    # 将二进制图片数据转换为base64 data URL（bytes 级拼接，少一次拷贝）
+                    image_parts.append({
+                        "type": "image_url",
+                        "image_url": {"url": _make_data_url(img_data)}
+                    })
+                    log_image_operation("转换输入图片", f"第{j+1}张: {len(img_data)}字节 -> base64")
+        return image_parts
+
+    def _build_request_content(self, prompt: str, images: list,
+                               image_parts: Optional[list] = None) -> list:
+        """
+        构建 Chat Completions 消息内容（文本 + base64 图片）
+
+        批量并发路径预先编码好 image_parts 并在所有请求间复用，
+        避免 image_count 次重复 base64 编码同一批输入图片
+        """
+        if image_parts is None:
+            image_parts = self._build_image_parts(images)
+        return [{"type": "text", "text": prompt}, *image_parts]
+
+    def _handle_response(self, response) -> bytes:
+        """从 Chat Completions 响应中提取图片字节"""
+        # 输出响应日志（惰性求值：日志级别被过滤时不做 model_dump + 截断）
+        log_provider_message('openrouter', "响应: %s", "INFO",
+                             lambda: self._truncate_logs(response.model_dump()))
 
         # 提取图片数据
         if response.choices and len(response.choices) > 0:
@@ -139,7 +373,7 @@ class OpenRouterProvider(ImageProvider):
                     return image_bytes
                 else:
                     error_msg = "所有提取方法均失败"
-                    log_error('图片提取失败', error_msg, f"message: {message.model_dump_json()[:500]}")
+                    log_error('图片提取失败', error_msg, f"message: {self._short_dump(message)}")
                     raise RuntimeError(error_msg)
 
             except ValueError as e:
@@ -151,6 +385,33 @@ class OpenRouterProvider(ImageProvider):
             log_provider_message('openrouter', error_msg, "WARNING")
             raise RuntimeError(error_msg)
 
+    def _short_dump(self, message, limit: int = 500) -> str:
+        """
+        生成 pydantic 模型的截断字符串表示（仅用于失败日志）
+
+        model_dump_json()[:500] 会先序列化整个模型——响应里若带数 MB 的
+        base64 字符串，等于为 500 字符的日志做全量序列化。这里先在
+        dict 层截断每个顶层字段值，再 json.dumps 小字典
+        """
+        trimmed = {key: (value if not isinstance(value, str) or len(value) <= 100
+                         else value[:100] + '...')
+                   for key, value in message.model_dump().items()}
+        return json.dumps(trimmed, ensure_ascii=False, default=str)[:limit]
+
+    def _has_long_string(self, data) -> bool:
+        """快速检查数据中是否存在超过500字符的字符串（找到即停，不分配新对象）"""
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                if len(node) > 500:
+                    return True
+            elif isinstance(node, dict):
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+        return False
+
     def _truncate_logs(self, data):
         """
         递归截断字典中的长字符串，避免日志刷屏
@@ -161,6 +422,10 @@ class OpenRouterProvider(ImageProvider):
         Returns:
             处理后的数据（超过500字符的字符串被截断）
         """
+        # 常见情况没有长字符串：先做一次廉价扫描，避免整棵对象树的重建拷贝
+        if not self._has_long_string(data):
+            return data
+
         if isinstance(data, dict):
             return {key: self._truncate_logs(value) for key, value in data.items()}
         elif isinstance(data, list):
@@ -177,11 +442,15 @@ class OpenRouterProvider(ImageProvider):
         从 ChatCompletionMessage 对象中提取图像数据（全格式兼容）
 
         检查顺序（优先级递减）：
-        0. Deep Search - 递归暴力搜索（新增）
         1. message.refusal - 检查是否被拒绝
-        2. message.images - OpenRouter 扩展字段（最常见）
+        2. message.images - OpenRouter 扩展字段（最常见，O(1) 快路径）
         3. message.tool_calls - 工具调用附件
         4. message.content - Markdown/URL/Base64
+        5. Deep Search - 递归暴力搜索（慢路径，处理长尾格式）
+
+        常见成功场景在类型化字段上即可命中，完全不需要付出
+        model_dump() 整棵模型序列化 + 全树遍历的代价；
+        Deep Search 仅在所有快路径落空时执行
 
         Returns:
             bytes: 图像二进制数据
@@ -190,35 +459,32 @@ class OpenRouterProvider(ImageProvider):
             ValueError: 模型拒绝生成
         """
 
-        # ========== 最高优先级: Deep Search 暴力提取 ==========
-        log_provider_message('openrouter', "开始 Deep Search 递归搜索...")
-        image_bytes = self._find_image_in_payload(message.model_dump())
-        if image_bytes:
-            log_provider_message('openrouter', f"Deep Search 成功提取图片: {len(image_bytes)}字节")
-            return image_bytes
-        log_provider_message('openrouter', "Deep Search 未找到图片，使用 fallback 逻辑")
+        # 属性只解析一次：hasattr + 属性读取对 pydantic 模型是两次描述符查找
+        refusal = getattr(message, 'refusal', None)
+        images = getattr(message, 'images', None)
+        tool_calls = getattr(message, 'tool_calls', None)
+        content = getattr(message, 'content', None)
 
         # ========== 情况 D: Refusal 检查 ==========
-        if hasattr(message, 'refusal') and message.refusal:
-            error_msg = f"模型拒绝生成: {message.refusal}"
-            log_error('模型拒绝', message.refusal, "OpenRouter 模型明确拒绝此请求")
+        if refusal:
+            error_msg = f"模型拒绝生成: {refusal}"
+            log_error('模型拒绝', refusal, "OpenRouter 模型明确拒绝此请求")
             raise ValueError(error_msg)
 
         # ========== 情况 A: message.images 字段（OpenRouter 官方格式） ==========
-        if hasattr(message, 'images') and message.images:
-            log_provider_message('openrouter', f"检测到 message.images 字段: {len(message.images)} 张图片")
+        if images:
+            log_provider_message('openrouter', f"检测到 message.images 字段: {len(images)} 张图片")
 
-            for idx, image_item in enumerate(message.images):
+            for idx, image_item in enumerate(images):
                 # OpenRouter 格式: "data:image/png;base64,iVBOR..."
                 if isinstance(image_item, str) and image_item.startswith('data:image/'):
                     log_provider_message('openrouter', f"解析第 {idx+1} 张图片 (data URL 格式)")
 
                     # 提取 base64 部分
-                    data_url_pattern = r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)'
-                    match = re.search(data_url_pattern, image_item)
+                    match = _DATA_URL_RE.search(image_item)
                     if match:
                         image_bytes = self._safe_base64_decode(match.group(1))
-                        if image_bytes:
+                        if image_bytes and self._is_valid_image(image_bytes):
                             log_image_operation("message.images 提取成功",
                                               f"{len(image_bytes)}字节 (data URL)")
                             return image_bytes
@@ -226,39 +492,54 @@ class OpenRouterProvider(ImageProvider):
                 # 备选：直接 base64 字符串
                 elif isinstance(image_item, str):
                     image_bytes = self._safe_base64_decode(image_item)
-                    if image_bytes:
+                    if image_bytes and self._is_valid_image(image_bytes):
                         log_image_operation("message.images 提取成功",
                                           f"{len(image_bytes)}字节 (纯 base64)")
                         return image_bytes
 
         # ========== 情况 C: message.tool_calls 检查 ==========
-        if hasattr(message, 'tool_calls') and message.tool_calls:
-            log_provider_message('openrouter', f"检测到 message.tool_calls: {len(message.tool_calls)} 个调用")
+        if tool_calls:
+            log_provider_message('openrouter', f"检测到 message.tool_calls: {len(tool_calls)} 个调用")
 
-            for tool_call in message.tool_calls:
+            for tool_call in tool_calls:
                 # 检查工具调用的参数
-                if hasattr(tool_call, 'function') and hasattr(tool_call.function, 'arguments'):
+                function = getattr(tool_call, 'function', None)
+                arguments = getattr(function, 'arguments', None) if function else None
+                if arguments:
                     try:
-                        args = json.loads(tool_call.function.arguments)
+                        args = _json_loads(arguments)
 
                         # 尝试从常见字段提取图像
                         for key in ['image', 'data', 'b64_json', 'image_data']:
                             if key in args and args[key]:
                                 image_bytes = self._safe_base64_decode(args[key])
-                                if image_bytes:
+                                if image_bytes and self._is_valid_image(image_bytes):
                                     log_image_operation("tool_calls 提取成功",
                                                       f"{len(image_bytes)}字节 (工具调用)")
                                     return image_bytes
-                    except json.JSONDecodeError:
+                    except (json.JSONDecodeError, ValueError):
                         continue
 
         # ========== 情况 B: message.content 检查（现有逻辑） ==========
-        if hasattr(message, 'content') and message.content:
-            log_provider_message('openrouter', f"检查 message.content 字段: {len(message.content)}字符")
-            return self._extract_image_data_from_content(message.content)
+        if content:
+            log_provider_message('openrouter', f"检查 message.content 字段: {len(content)}字符")
+            image_bytes = self._extract_image_data_from_content(content)
+            if image_bytes:
+                return image_bytes
+
+        # ========== 慢路径: Deep Search 暴力提取（仅在快路径全部落空时） ==========
+        # model_dump 只计算一次：Deep Search 与失败日志共用同一份 dict
+        payload = message.model_dump()
+
+        log_provider_message('openrouter', "开始 Deep Search 递归搜索...")
+        image_bytes = self._find_image_in_payload(payload)
+        if image_bytes:
+            log_provider_message('openrouter', f"Deep Search 成功提取图片: {len(image_bytes)}字节")
+            return image_bytes
+        log_provider_message('openrouter', "Deep Search 未找到图片", "WARNING")
 
         # 所有方法都失败，抛出异常（有响应但无图片，通常是内容问题）
-        truncated_response = self._truncate_logs(message.model_dump())
+        truncated_response = self._truncate_logs(payload)
         log_error('图像提取完全失败', '所有提取方法均失败', f"响应: {truncated_response}")
         raise ValueError(f"无法从响应中提取图片数据。响应摘要: {str(truncated_response)[:300]}")
 
@@ -288,71 +569,61 @@ class OpenRouterProvider(ImageProvider):
                 log_error('检测到拒绝响应', keyword, f"上下文: {context}")
                 raise ValueError(f"模型拒绝生成（包含关键词'{keyword}'）: {context}")
 
-        # Step 1: Markdown 图片链接
-        markdown_pattern = r'!\[.*?\]\((https?://[^\s)]+)\)'
-        markdown_matches = re.findall(markdown_pattern, content)
-        if markdown_matches:
-            log_provider_message('openrouter', f"找到 Markdown 图片链接: {len(markdown_matches)} 个")
-            for url in markdown_matches:
-                image_bytes = self._download_image(url)
-                if image_bytes:
+        # Step 1: 单遍扫描文本格式候选（Markdown 链接 / data URL / 纯图片 URL）
+        # 每个候选按出现顺序依次尝试，命中即返回，避免逐阶段重扫整个 content
+        for kind, value in _iter_image_candidates(content):
+            if kind == 'b64':
+                log_provider_message('openrouter', "找到 data URL 格式候选")
+                image_bytes = self._safe_base64_decode(value)
+                if image_bytes and self._is_valid_image(image_bytes):
+                    log_image_operation("data URL提取图片", f"成功提取: {len(image_bytes)}字节")
                     return image_bytes
-
-        # Step 2: Plain URL
-        url_pattern = r'https?://[^\s]*\.(png|jpg|jpeg|webp|gif)(?:\?[^\s]*)?'
-        url_matches = re.findall(url_pattern, content, re.IGNORECASE)
-        if url_matches:
-            log_provider_message('openrouter', f"找到纯图片 URL: {len(url_matches)} 个")
-            for match in url_matches:
-                # match 是 tuple (url, extension)，需要重构完整URL
-                url = re.search(url_pattern, content, re.IGNORECASE).group(0)
-                image_bytes = self._download_image(url)
+            else:
+                log_provider_message('openrouter', f"找到图片 URL 候选 ({kind}): {value[:80]}")
+                image_bytes = self._download_image(value)
                 if image_bytes:
                     return image_bytes
 
-        # Step 3: JSON/Base64
-        try:
-            content_data = json.loads(content)
-            log_provider_message('openrouter', "检测到 JSON 格式内容")
-
-            # 处理字典格式
-            if isinstance(content_data, dict):
-                for key in ['image', 'data', 'b64_json']:
-                    if key in content_data and content_data[key]:
-                        image_bytes = self._safe_base64_decode(content_data[key])
-                        if image_bytes:
-                            log_image_operation("JSON提取图片", f"从JSON字典{key}字段成功提取: {len(image_bytes)}字节")
-                            return image_bytes
-
-            # 处理列表格式
-            elif isinstance(content_data, list):
-                for item in content_data:
-                    if isinstance(item, dict):
-                        if item.get('type') == 'image' and 'data' in item:
-                            image_bytes = self._safe_base64_decode(item['data'])
-                            if image_bytes:
-                                log_image_operation("JSON提取图片", f"从JSON列表成功提取: {len(image_bytes)}字节")
+        # Step 2: JSON/Base64（JSON 结构无法并入正则单遍扫描，单独处理）
+        # 一字节预检：首个非空白字符不是 '{'/'[' 就不可能是 JSON 容器，
+        # 免去对多 MB 纯文本做一次注定失败的 tokenize
+        if content[:16].lstrip()[:1] in ('{', '['):
+            try:
+                content_data = _json_loads(content)
+                log_provider_message('openrouter', "检测到 JSON 格式内容")
+
+                # 处理字典格式
+                if isinstance(content_data, dict):
+                    for key in ['image', 'data', 'b64_json']:
+                        if key in content_data and content_data[key]:
+                            image_bytes = self._safe_base64_decode(content_data[key])
+                            if image_bytes and self._is_valid_image(image_bytes):
+                                log_image_operation("JSON提取图片", f"从JSON字典{key}字段成功提取: {len(image_bytes)}字节")
                                 return image_bytes
 
-        except json.JSONDecodeError:
-            log_provider_message('openrouter', "不是有效的JSON格式，继续尝试其他方式", "WARNING")
+                # 处理列表格式
+                elif isinstance(content_data, list):
+                    for item in content_data:
+                        if isinstance(item, dict):
+                            if item.get('type') == 'image' and 'data' in item:
+                                image_bytes = self._safe_base64_decode(item['data'])
+                                if image_bytes and self._is_valid_image(image_bytes):
+                                    log_image_operation("JSON提取图片", f"从JSON列表成功提取: {len(image_bytes)}字节")
+                                    return image_bytes
 
-        # Step 4: data URL 格式
-        data_url_pattern = r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)'
-        data_url_match = re.search(data_url_pattern, content)
-        if data_url_match:
-            log_provider_message('openrouter', "找到 data URL 格式")
-            image_bytes = self._safe_base64_decode(data_url_match.group(1))
-            if image_bytes:
-                log_image_operation("data URL提取图片", f"成功提取: {len(image_bytes)}字节")
-                return image_bytes
+            except (json.JSONDecodeError, ValueError):
+                log_provider_message('openrouter', "不是有效的JSON格式", "WARNING")
 
         log_error('图片数据提取失败', '所有提取方法均失败', f"内容前200字符: {content[:200]}")
         return None
 
     def _find_image_in_payload(self, data) -> bytes:
         """
-        递归搜索响应数据中的图片（暴力提取）
+        Deep Search: 迭代搜索响应数据中的图片（暴力提取）
+
+        使用显式 deque 工作队列代替递归：不再为每个节点分配 Python 栈帧，
+        优先级字段（b64_json/url/images/tool_calls）先于普通字段处理，
+        黑名单字段与明显不可能包含图片的节点直接剪枝
 
         Args:
             data: 任意类型的数据（字典/列表/字符串等）
@@ -360,84 +631,94 @@ class OpenRouterProvider(ImageProvider):
         Returns:
             bytes: 图片二进制数据，未找到返回 None
         """
-        # 快速路径：优先检查常见的结构化图片字段
-        if isinstance(data, dict):
-            # Priority 0: 检查 images 字段（最常见）
-            if 'images' in data and data['images']:
-                log_provider_message('openrouter', "Deep Search: 找到 'images' 字段，优先检查")
-                result = self._find_image_in_payload(data['images'])
-                if result:
-                    return result
-
-            # Priority 1: 检查 tool_calls
-            if 'tool_calls' in data and data['tool_calls']:
-                log_provider_message('openrouter', "Deep Search: 找到 'tool_calls' 字段，优先检查")
-                result = self._find_image_in_payload(data['tool_calls'])
-                if result:
-                    return result
-
-            # Priority 2: 检查 b64_json
-            if 'b64_json' in data and isinstance(data['b64_json'], str):
-                log_provider_message('openrouter', "Deep Search: 找到 'b64_json' 字段")
-                image_bytes = self._safe_base64_decode(data['b64_json'])
-                if image_bytes and self._is_valid_image(image_bytes):
-                    return image_bytes
-
-        # 处理字典
-        if isinstance(data, dict):
-            # 优先检查特定的 url 字段（Target 3）
-            if 'url' in data and isinstance(data['url'], str):
-                url = data['url']
-                if url.startswith('http') and re.search(r'\.(png|jpg|jpeg|webp|gif)($|\?)', url, re.IGNORECASE):
-                    log_provider_message('openrouter', f"Deep Search: 找到图片 URL: {url[:80]}")
-                    image_bytes = self._download_image(url)
-                    if image_bytes:
+        queue = deque([data])
+
+        while queue:
+            node = queue.popleft()
+
+            if isinstance(node, dict):
+                # Priority 0: b64_json 直接解码
+                b64_json = node.get('b64_json')
+                if isinstance(b64_json, str):
+                    if _DEEP_SEARCH_DEBUG:
+                        log_provider_message('openrouter', "Deep Search: 找到 'b64_json' 字段")
+                    image_bytes = self._safe_base64_decode(b64_json)
+                    if image_bytes and self._is_valid_image(image_bytes):
                         return image_bytes
 
-            # 递归检查所有值（跳过黑名单字段）
-            # 黑名单：跳过非图片数据字段
-            BLACKLIST_KEYS = {
-                'reasoning', 'reasoning_details',
-                'usage', 'prompt_tokens_details',
-                'annotations'
-            }
-
-            for key, value in data.items():
-                if key in BLACKLIST_KEYS:
-                    log_provider_message('openrouter', f"Deep Search: 跳过黑名单字段 '{key}'")
-                    continue
-                result = self._find_image_in_payload(value)
-                if result:
-                    return result
+                # Priority 1: url 字段（HTTP 直接下载，data URL 就地解码——
+                # 'url' 在 _PRIORITY_KEYS 中不会再入队，必须在这里处理掉）
+                url = node.get('url')
+                if isinstance(url, str):
+                    if url.startswith('http') and _IMAGE_EXT_RE.search(url):
+                        if _DEEP_SEARCH_DEBUG:
+                            log_provider_message('openrouter', f"Deep Search: 找到图片 URL: {url[:80]}")
+                        image_bytes = self._download_image(url)
+                        if image_bytes:
+                            return image_bytes
+                    elif url.startswith('data:image'):
+                        if _DEEP_SEARCH_DEBUG:
+                            log_provider_message('openrouter', "Deep Search: url 字段为 data:image URL")
+                        match = _DATA_URL_RE.search(url)
+                        if match:
+                            image_bytes = self._safe_base64_decode(match.group(1))
+                            if image_bytes and self._is_valid_image(image_bytes):
+                                return image_bytes
 
-        # 处理列表
-        elif isinstance(data, list):
-            for item in data:
-                result = self._find_image_in_payload(item)
-                if result:
-                    return result
+                # Priority 2: images / tool_calls 子树排到队首优先处理
+                for key in ('tool_calls', 'images'):
+                    value = node.get(key)
+                    if value:
+                        if _DEEP_SEARCH_DEBUG:
+                            log_provider_message('openrouter', f"Deep Search: 找到 '{key}' 字段，优先检查")
+                        queue.appendleft(value)
+
+                # 其余字段排到队尾（跳过黑名单与已处理的优先级字段）
+                for key, value in node.items():
+                    if key in _BLACKLIST_KEYS:
+                        if _DEEP_SEARCH_DEBUG:
+                            log_provider_message('openrouter', f"Deep Search: 跳过黑名单字段 '{key}'")
+                        continue
+                    if key in _PRIORITY_KEYS:
+                        continue
+                    # 剪枝：仅入队可能包含图片的节点
+                    if isinstance(value, (dict, list)):
+                        queue.append(value)
+                    elif isinstance(value, str) and (
+                            len(value) > 5000 or value.startswith('data:image')):
+                        queue.append(value)
+
+            elif isinstance(node, list):
+                for item in node:
+                    if isinstance(item, (dict, list, str)):
+                        queue.append(item)
+
+            elif isinstance(node, str):
+                # Target 1: data:image 开头的 Data URL
+                if node.startswith('data:image'):
+                    if _DEEP_SEARCH_DEBUG:
+                        log_provider_message('openrouter', "Deep Search: 找到 data:image URL")
+                    match = _DATA_URL_RE.search(node)
+                    if match:
+                        image_bytes = self._safe_base64_decode(match.group(1))
+                        if image_bytes and self._is_valid_image(image_bytes):
+                            return image_bytes
 
-        # 处理字符串
-        elif isinstance(data, str):
-            # Target 1: data:image 开头的 Data URL
-            if data.startswith('data:image'):
-                log_provider_message('openrouter', "Deep Search: 找到 data:image URL")
-                match = re.search(r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)', data)
-                if match:
-                    image_bytes = self._safe_base64_decode(match.group(1))
-                    if image_bytes:
+                # Target 2: 疑似 Raw Base64（长度 >5000 且不含空格）
+                # O(1) 前缀预筛：不以已知图片格式的 base64 前缀开头的长字符串
+                # （如超长 reasoning/URL）直接跳过，不做整串解码
+                elif len(node) > 5000 and ' ' not in node \
+                        and _looks_like_base64_image(node):
+                    if _DEEP_SEARCH_DEBUG:
+                        log_provider_message('openrouter', f"Deep Search: 检测到疑似 Raw Base64 (len={len(node)})")
+                    image_bytes = self._safe_base64_decode(node)
+                    # 验证解码结果是否为有效图片（文件头魔数校验）
+                    if image_bytes and self._is_valid_image(image_bytes):
+                        if _DEEP_SEARCH_DEBUG:
+                            log_provider_message('openrouter', f"Deep Search: Raw Base64 解码并验证成功: {len(image_bytes)}字节")
                         return image_bytes
-
-            # Target 2: 疑似 Raw Base64（长度 >5000 且不含空格）
-            elif len(data) > 5000 and ' ' not in data:
-                log_provider_message('openrouter', f"Deep Search: 检测到疑似 Raw Base64 (len={len(data)})")
-                image_bytes = self._safe_base64_decode(data)
-                # 验证解码结果是否为有效图片（文件头魔数校验）
-                if image_bytes and self._is_valid_image(image_bytes):
-                    log_provider_message('openrouter', f"Deep Search: Raw Base64 解码并验证成功: {len(image_bytes)}字节")
-                    return image_bytes
-                else:
-                    log_provider_message('openrouter', "Deep Search: Raw Base64 解码后文件头验证失败，跳过", "WARNING")
+                    elif _DEEP_SEARCH_DEBUG:
+                        log_provider_message('openrouter', "Deep Search: Raw Base64 解码后文件头验证失败，跳过", "WARNING")
 
         return None
 
@@ -445,6 +726,10 @@ class OpenRouterProvider(ImageProvider):
         """
         验证字节数据是否为有效图片（通过文件头魔数）
 
+        Deep Search 对每个候选都会调用本函数，因此用单次 4 字节前缀读取
+        + 整数比较代替多次切片（每次切片都分配新 bytes 对象），
+        并且不在此热函数内打日志
+
         Args:
             data: 解码后的二进制数据
 
@@ -454,35 +739,32 @@ class OpenRouterProvider(ImageProvider):
         if not data or len(data) < 8:
             return False
 
-        # 检查常见图片格式的魔数（文件头）
-        # PNG: \x89PNG
-        if data[:4] == b'\x89PNG':
-            log_provider_message('openrouter', "文件头验证: PNG 格式")
+        # JPEG: \xff\xd8\xff（字节索引返回 int，无分配）
+        if data[0] == 0xFF and data[1] == 0xD8 and data[2] == 0xFF:
             return True
 
-        # JPEG: \xff\xd8\xff
-        if data[:3] == b'\xff\xd8\xff':
-            log_provider_message('openrouter', "文件头验证: JPEG 格式")
+        prefix = int.from_bytes(data[:4], 'big')
+
+        # PNG: \x89PNG
+        if prefix == _PNG_MAGIC:
             return True
 
         # WEBP: RIFF....WEBP
-        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
-            log_provider_message('openrouter', "文件头验证: WEBP 格式")
-            return True
+        if prefix == _RIFF_MAGIC:
+            return len(data) >= 12 and data[8] == 0x57 and data[9] == 0x45 \
+                and data[10] == 0x42 and data[11] == 0x50
 
         # GIF: GIF87a 或 GIF89a
-        if data[:6] in (b'GIF87a', b'GIF89a'):
-            log_provider_message('openrouter', "文件头验证: GIF 格式")
-            return True
+        if prefix == _GIF_MAGIC:
+            return data[4] in (0x37, 0x39) and data[5] == 0x61
 
-        log_provider_message('openrouter', f"文件头验证失败: 前8字节 = {data[:8]}", "WARNING")
         return False
 
     def _download_image(self, url: str) -> bytes:
         """从 URL 下载图片"""
         try:
             log_provider_message('openrouter', f"开始下载图片: {url[:80]}...")
-            response = requests.get(url, timeout=10)
+            response = self._session.get(url, timeout=10)
             if response.status_code == 200:
                 log_image_operation("URL下载成功", f"从URL成功下载: {len(response.content)}字节")
                 return response.content
@@ -496,11 +778,23 @@ class OpenRouterProvider(ImageProvider):
         """安全的base64解码，处理padding和无效字符"""
         try:
             data_str = data_str.strip()
-            # 确保正确的padding
-            missing_padding = len(data_str) % 4
+            # 单遍预检：字符集不合法直接跳过，避免完整解码 + 异常开销
+            valid, missing_padding = _b64_precheck(data_str)
+            if not valid:
+                # JSON 响应里的 base64 可能带 MIME 折行（内嵌 \n），
+                # translate 单遍删除全部空白后再给一次机会
+                cleaned = data_str.translate(_WS_DELETE_TABLE)
+                if len(cleaned) != len(data_str):
+                    data_str = cleaned
+                    valid, missing_padding = _b64_precheck(data_str)
+            if not valid:
+                log_error('base64解码错误', '字符集预检失败', f"数据前50字符: {data_str[:50]}")
+                return None
             if missing_padding:
-                data_str += '=' * (4 - missing_padding)
-            decoded = base64.b64decode(data_str)
+                data_str += '=' * missing_padding
+            # validate=True：字符集已由预检保证不会报错，且让 pybase64
+            # 走 SIMD 快路径（validate=False 会退回逐字符过滤的慢路径）
+            decoded = _b64.b64decode(data_str, validate=True)
             return decoded
         except Exception as e:
             log_error('base64解码错误', str(e), f"数据前50字符: {data_str[:50]}")
@@ -18,9 +18,15 @@ Last Updated: 2025-11-30
 
 import base64
 import json
+from binascii import a2b_base64
+from collections import deque
+from io import BytesIO
 import re
-import time
+from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 from openai import OpenAI
 from .base import ImageProvider
@@ -29,14 +35,214 @@ from ..logging_config import log_provider_message, log_api_call, log_error, log_
 from ..config import get_provider_base_url
 
 
+# SIMD 加速的 base64 编解码（libbase64: AVX2/AVX-512/NEON），
+# 对多 MB 图片有数倍吞吐提升；未安装时回退标准库
+try:
+    import pybase64 as _b64
+except ImportError:
+    _b64 = base64
+
+
+# Deep Search 使用的正则，模块加载时编译一次，避免每个节点访问
+# 都走 re 模块的 LRU 缓存查找
+_URL_EXT_RE = re.compile(r'\.(png|jpg|jpeg|webp|gif)($|\?)', re.IGNORECASE)
+_MD_IMG_RE = re.compile(r'!\[.*?\]\(([^)]+)\)')
+
+# OpenAI 客户端按 (api_key, base_url) 缓存：get_provider 每次请求都会
+# 新建 Provider 实例，复用客户端即复用其内部 httpx 连接池与 TLS 会话，
+# 免去每个请求重新 TCP+TLS 握手
+_CLIENTS: dict = {}
+
+
+def _get_client(api_key: str, base_url: str) -> OpenAI:
+    """获取（或创建并缓存）指定 key/base_url 的 OpenAI 客户端"""
+    cache_key = (api_key, base_url)
+    client = _CLIENTS.get(cache_key)
+    if client is None:
+        client = _CLIENTS.setdefault(
+            cache_key, OpenAI(api_key=api_key, base_url=base_url))
+    return client
+
+
+def _detect_mime(img_data: bytes) -> str:
+    """
+    通过文件头魔数检测图片 MIME 类型
+
+    与 _is_valid_image 相同的判定逻辑；无法识别时回退 image/jpeg
+    （与旧版硬编码行为一致），每张输入图片只检测一次
+    """
+    if img_data.startswith(b'\x89PNG'):
+        return 'image/png'
+    if img_data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if img_data.startswith(b'RIFF'):
+        return 'image/webp'
+    if img_data.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    return 'image/jpeg'
+
+
+def _make_data_url(img_data: bytes) -> str:
+    """
+    把图片字节编码为 data URL 字符串（MIME 按魔数检测，不再硬编码 jpeg）
+
+    pybase64 可用时用 b64encode_as_string 直接产出 str（一次分配，
+    省去 bytes->str 解码的中间拷贝）；否则在 bytes 层拼接前缀后
+    只做一次 ascii 解码。两条路径都避免了 f-string 对整段 base64
+    的额外整串拷贝
+    """
+    prefix = 'data:' + _detect_mime(img_data) + ';base64,'
+    if _b64 is not base64:
+        return prefix + _b64.b64encode_as_string(img_data)
+    return (prefix.encode('ascii') + _b64.b64encode(img_data)).decode('ascii')
+
+
+# 输入图片最长边上限：超过后按 Lanczos 等比缩小再编码上传
+_MAX_INPUT_EDGE = 1024
+
+
+def _maybe_downscale(img_data: bytes) -> bytes:
+    """
+    超大输入图片在 base64 编码前等比缩小（最长边不超过 1024 像素）
+
+    一张 10MB 的原图 base64 后约 13MB 上行流量；缩小后带宽与编码
+    开销通常降到原来的几分之一。缩放失败（非图片、不支持的模式等）
+    时按原图上传，不影响功能
+    """
+    try:
+        image = Image.open(BytesIO(img_data))
+        if max(image.size) <= _MAX_INPUT_EDGE:
+            return img_data
+        original_size = image.size
+        image.thumbnail((_MAX_INPUT_EDGE, _MAX_INPUT_EDGE), Image.LANCZOS)
+        buffer = BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # 可能带透明通道，保留为 PNG
+            image.save(buffer, format='PNG')
+        else:
+            image.save(buffer, format='JPEG', quality=88)
+        result = buffer.getvalue()
+        log_image_operation(
+            "缩放输入图片",
+            f"{original_size[0]}x{original_size[1]} -> "
+            f"{image.size[0]}x{image.size[1]}, "
+            f"{len(img_data)}字节 -> {len(result)}字节")
+        return result
+    except Exception as e:
+        log_provider_message('tuzi', f"输入图片缩放失败，按原图上传: {e}", "WARNING")
+        return img_data
+
+
+# 单次图片下载的大小上限（Content-Length 声明值与实际读取量都受限）
+_MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+# base64 候选串的长度区间：下限对应 _is_valid_image 所需的最小文件头，
+# 上限防止病态超长 ASCII 串触发数百 MB 的解码输出缓冲分配
+_MIN_B64_LENGTH = 16
+_MAX_B64_LENGTH = 50_000_000
+
+# 一次 C 级扫描删除 base64 中的内嵌空白（MIME 折行的 \n 等），
+# 供 pybase64 解码路径在失败时做第二次机会清洗
+_WS_DELETE_TABLE = str.maketrans('', '', ' \t\n\r\x0b\x0c')
+
+# 各图片格式文件头对应的 base64 前缀（PNG/JPEG/GIF/WEBP）：
+# base64 前缀与原始字节前缀一一对应，O(1) 的 startswith 即可排除
+# 不可能解码出图片的候选串
+_B64_IMAGE_PREFIXES = ('iVBORw0KG', '/9j/', 'R0lGOD', 'UklGR')
+
+# 图片文件头魔数（前 8 字节按大端打包成单个 int 后做掩码比较）
+_PNG_SIG = 0x89504E470D0A1A0A            # \x89PNG\r\n\x1a\n
+_JPEG_MASK = 0xFFFFFF0000000000
+_JPEG_SIG = 0xFFD8FF0000000000           # \xff\xd8\xff
+_GIF_MASK = 0xFFFFFFFFFFFF0000
+_GIF87_SIG = 0x4749463837610000          # GIF87a
+_GIF89_SIG = 0x4749463839610000          # GIF89a
+_RIFF_MASK = 0xFFFFFFFF00000000
+_RIFF_SIG = 0x5249464600000000           # RIFF
+
+# Deep Search dict 分支中已单独处理的优先级字段，通用遍历时跳过，
+# 避免 b64_json 校验失败后被通用字符串分支再解码一遍
+_PRIORITY_KEYS = frozenset({'b64_json', 'tool_calls', 'url'})
+
+# Deep Search 跳过的黑名单字段（每个进程只构建一次）
+_BLACKLIST_KEYS = frozenset({
+    'reasoning', 'reasoning_details',
+    'usage', 'prompt_tokens_details',
+    'annotations'
+})
+
+# 内容审核拒绝关键词（预先小写，扫描时不再逐个 .lower()）
+_REFUSAL_KEYWORDS_LOWER = tuple(k.lower() for k in [
+    # 英文关键词（通用）
+    "sorry", "cannot", "can't", "unable to",
+    "don't", "won't", "inappropriate",
+    "against our policy", "violates", "prohibited",
+
+    # 平台特定关键词
+    "blocked by Google Gemini",
+    "PROHIBITED_CONTENT",
+    "SAFETY",
+    "blocked by policy",
+    "content is prohibited",
+    "violates our content policy",
+
+    # 中文关键词
+    "抱歉", "无法", "不能", "不符合",
+    "违反", "禁止", "政策"
+])
+
+# 软拒绝关键词（响应有内容但提取不到图片时的隐式拒绝检测）
+_SOFT_REFUSAL_KEYWORDS = (
+    "sorry", "cannot", "can't", "unable to",
+    "don't", "won't", "inappropriate",
+    "against", "policy", "guidelines"
+)
+
+# 关键词合并为单个正则交替：对内容做一次 C 级 DFA 扫描，
+# 代替每个关键词一趟 `in` 的多遍线性扫描；IGNORECASE 由正则引擎
+# 处理大小写，免去对（可能多 KB 的）content 做整串 .lower() 拷贝
+_REFUSAL_RE = re.compile('|'.join(map(re.escape, _REFUSAL_KEYWORDS_LOWER)),
+                         re.IGNORECASE)
+_SOFT_REFUSAL_RE = re.compile('|'.join(map(re.escape, _SOFT_REFUSAL_KEYWORDS)),
+                              re.IGNORECASE)
+
+
+class _StreamMessage:
+    """流式响应聚合后的伪消息对象（模块级定义，避免每次回退调用重建类型）"""
+
+    __slots__ = ('content', 'refusal', 'multi_mod_content')
+
+    def __init__(self, content, multi_mod_content=None):
+        self.content = content
+        self.refusal = None
+        self.multi_mod_content = multi_mod_content
+
+    def model_dump(self):
+        result = {"content": self.content}
+        if self.multi_mod_content:
+            result["multi_mod_content"] = self.multi_mod_content
+        return result
+
+
 class TuziProvider(ImageProvider):
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = get_provider_base_url('tuzi')
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=self.base_url
+        self.client = _get_client(api_key, self.base_url)
+
+        # 图片下载复用连接池：同一响应含多个图片 URL 时免去逐个 TLS 握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=2, backoff_factor=0.3,
+                              status_forcelist=[429, 500, 502, 503, 504])
         )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        # 同一 URL 在一次请求生命周期内只下载一次
+        self._url_cache = {}
 
     def generate(self, prompt: str, images: list, temperature: float,
                  model: str, image_count: int, **kwargs) -> list[bytes]:
@@ -62,27 +268,57 @@ class TuziProvider(ImageProvider):
 
         generated_images = []
 
-        for i in range(image_count):
-            log_provider_message('tuzi', f"生成第 {i+1}/{image_count} 张图片")
+        # 消息内容只构建一次（输入图片只做一次 base64 编码），
+        # n 参数批量路径与逐张回退路径共享
+        content = self._build_content(prompt, images)
 
+        # 优先尝试单次请求携带 n 参数：N 次往返 + (N-1)×500ms 限速
+        # 合并为一次 HTTP 请求，服务端 prompt 处理在各 choice 间共享
+        if image_count > 1:
+            try:
+                generated_images = self._generate_batch_with_n(
+                    content, temperature, model, image_count)
+            except Exception as e:
+                log_provider_message('tuzi',
+                    f"n={image_count} 批量请求失败，回退逐张生成: {e}", "WARNING")
+                generated_images = []
+
+        if len(generated_images) >= image_count:
+            log_provider_message('tuzi',
+                f"生成完成: 成功生成 {len(generated_images)} 张图片 (n 参数批量)")
+            return generated_images
+
+        # 批量返回不足 image_count 张（常见于上游代理忽略 n 只回一个
+        # choice）时不能直接返回，剩余的走逐张路径补齐
+        missing = image_count - len(generated_images)
+        if generated_images:
+            log_provider_message('tuzi',
+                f"n 参数批量只返回 {len(generated_images)}/{image_count} 张，"
+                f"逐张补齐剩余 {missing} 张", "WARNING")
+
+        # 回退路径：上游代理不支持 n 参数时逐张生成
+        # IO 等待占主导，线程池并发代替串行 + 固定 sleep 限速：
+        # 总耗时从 N 次往返之和降为 ~1 次往返，429 由重试装饰器退避处理
+        def _generate_one(i: int):
+            log_provider_message('tuzi', f"生成第 {i+1}/{missing} 张图片")
             try:
                 image_bytes = self.generate_single(
                     prompt=prompt,
                     images=images,
                     temperature=temperature,
                     model=model,
+                    content=content,
                     **kwargs
                 )
-                generated_images.append(image_bytes)
                 log_image_operation("图片生成成功", f"第{i+1}张: {len(image_bytes)}字节")
-
+                return image_bytes
             except Exception as e:
                 log_error('Tuzi生成失败', str(e), f"第{i+1}张图片")
-                continue  # 跳过失败，继续下一张
+                return None  # 跳过失败，继续其他任务
 
-            # 速率限制
-            if i < image_count - 1:
-                time.sleep(0.5)
+        with ThreadPoolExecutor(max_workers=min(missing, 4)) as executor:
+            results = list(executor.map(_generate_one, range(missing)))
+        generated_images.extend(r for r in results if r is not None)
 
         # 检查是否所有图片都失败
         if not generated_images:
@@ -94,9 +330,66 @@ class TuziProvider(ImageProvider):
             f"生成完成: 成功生成 {len(generated_images)} 张图片")
         return generated_images
 
+    def _build_content(self, prompt: str, images: list) -> list:
+        """
+        构建 Chat Completions 消息内容（文本 + base64 图片）
+
+        在 generate 中调用一次，批量路径与回退路径共享同一份结果，
+        避免 image_count 次重复 base64 编码同一批输入图片
+        """
+        content = [{"type": "text", "text": prompt}]
+        for i, img_data in enumerate(images):
+            if isinstance(img_data, bytes):
+                img_data = _maybe_downscale(img_data)
+                content.append({
+                    "type": "image_url",
+                    "image_url": {"url": _make_data_url(img_data)}
+                })
+                log_image_operation("添加输入图片",
+                                  f"第{i+1}张: {len(img_data)}字节")
+        return content
+
+    def _generate_batch_with_n(self, content: list, temperature: float,
+                               model: str, image_count: int) -> list[bytes]:
+        """
+        单次非流式请求生成多张图片（Chat Completions 的 n 参数）
+
+        Args:
+            content: 预构建的消息内容（_build_content 的结果）
+            temperature: 温度参数
+            model: 模型 ID
+            image_count: 生成图片数量
+
+        Returns:
+            list[bytes]: 成功提取的图片列表（单个 choice 失败不影响其他）
+        """
+        log_api_call('tuzi', '调用 Chat Completions (n 参数批量)',
+                     f"model={model}, n={image_count}")
+
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": content}],
+            temperature=temperature,
+            n=image_count,
+            stream=False
+        )
+
+        generated_images = []
+        for idx, choice in enumerate(response.choices):
+            try:
+                image_bytes = self._extract_image_data_from_message(choice.message)
+                generated_images.append(image_bytes)
+                log_image_operation("图片生成成功",
+                                  f"choice[{idx}]: {len(image_bytes)}字节")
+            except Exception as e:
+                log_error('Tuzi生成失败', str(e), f"choice[{idx}]")
+                continue
+        return generated_images
+
     @common_retry_strategy
     def generate_single(self, prompt: str, images: list, temperature: float,
-                       model: str, image: Optional[bytes] = None, **kwargs) -> bytes:
+                       model: str, image: Optional[bytes] = None,
+                       content: Optional[list] = None, **kwargs) -> bytes:
         """
         生成单张图像（带重试保护）
 
@@ -106,6 +399,7 @@ class TuziProvider(ImageProvider):
             temperature: 温度参数
             model: 模型名称
             image: 未使用（保留兼容性）
+            content: 预构建的消息内容（批量路径复用，省去重复编码）
             **kwargs: 额外参数
 
         Returns:
@@ -121,10 +415,11 @@ class TuziProvider(ImageProvider):
         )
 
         # 直接使用流式请求，不再尝试非流式（消除双重请求）
-        return self._generate_with_stream(prompt, images, temperature, model)
+        return self._generate_with_stream(prompt, images, temperature, model, content)
 
     def _generate_with_stream(self, prompt: str, images: list,
-                             temperature: float, model: str) -> bytes:
+                             temperature: float, model: str,
+                             content: Optional[list] = None) -> bytes:
         """
         使用流式 Chat Completions API 生成图像（单一路径，消除双重请求）
 
@@ -133,6 +428,7 @@ class TuziProvider(ImageProvider):
             images: 输入图片字节列表
             temperature: 温度参数
             model: 模型 ID
+            content: 预构建的消息内容，为 None 时现场构建
 
         Returns:
             bytes: 图片二进制数据
@@ -145,18 +441,9 @@ class TuziProvider(ImageProvider):
             f"Chat Completions (流式): model={model}, temperature={temperature}, "
             f"输入图片={len(images)}")
 
-        # 构建消息内容
-        content = [{"type": "text", "text": prompt}]
-
-        for i, img_data in enumerate(images):
-            if isinstance(img_data, bytes):
-                img_b64 = base64.b64encode(img_data).decode('utf-8')
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}
-                })
-                log_image_operation("添加输入图片",
-                                  f"第{i+1}张: {len(img_data)}字节")
+        # 构建消息内容（批量路径已预构建时直接复用）
+        if content is None:
+            content = self._build_content(prompt, images)
 
         # 直接使用流式请求（不再尝试非流式）
         log_api_call('tuzi', '调用流式 Chat Completions', f"model={model}")
@@ -174,9 +461,16 @@ class TuziProvider(ImageProvider):
             raise RuntimeError(f"API 调用失败: {str(e)}")
 
         # 收集流式响应（支持 content 和 multi_mod_content）
-        full_content = ""
+        # 分片先入 list、结束后一次 join：+= 拼接对多 MB base64 流
+        # 是 O(n²) 的反复拷贝，join 只做一次终态分配
+        content_parts = []
         multi_mod_content = None
 
+        # 流式提前终止：markdown 图片链接一旦完整到达就不再消费后续
+        # 分片（通常只剩收尾文字与 usage 块）。'![' 哨兵记下起始分片，
+        # 之后出现 ')' 时才对哨兵起的尾段做一次 join + 正则确认
+        md_start = None
+
         for chunk in response:
             # 检查 choices 是否为空（最后一个 usage chunk 的 choices 为空数组）
             if not chunk.choices:
@@ -184,35 +478,34 @@ class TuziProvider(ImageProvider):
 
             delta = chunk.choices[0].delta
 
-            # 收集 content 字段
-            if delta.content:
-                full_content += delta.content
-
             # 收集 multi_mod_content 字段（通常在第一个 chunk）
             if hasattr(delta, 'multi_mod_content') and delta.multi_mod_content:
                 multi_mod_content = delta.multi_mod_content
                 log_provider_message('tuzi',
                     f"流式响应中检测到 multi_mod_content: {len(delta.multi_mod_content)} 项")
 
+            # 收集 content 字段
+            if delta.content:
+                content_parts.append(delta.content)
+                if md_start is None:
+                    if '![' in delta.content:
+                        md_start = len(content_parts) - 1
+                if md_start is not None and ')' in delta.content:
+                    if _MD_IMG_RE.search("".join(content_parts[md_start:])):
+                        log_provider_message('tuzi',
+                            "流式响应中 Markdown 图片链接已完整，提前停止消费")
+                        response.close()
+                        break
+
+        full_content = "".join(content_parts)
+
         log_provider_message('tuzi',
             f"流式响应完成: content长度={len(full_content)}, "
             f"multi_mod_content={'有' if multi_mod_content else '无'}")
 
         # 构造伪消息对象用于提取（包含 multi_mod_content）
-        class StreamMessage:
-            def __init__(self, content, multi_mod_content=None):
-                self.content = content
-                self.refusal = None
-                self._multi_mod_content = multi_mod_content
-
-            def model_dump(self):
-                result = {"content": self.content}
-                if self._multi_mod_content:
-                    result["multi_mod_content"] = self._multi_mod_content
-                return result
-
         return self._extract_image_data_from_message(
-            StreamMessage(full_content, multi_mod_content))
+            _StreamMessage(full_content, multi_mod_content))
 
     def _extract_image_data_from_message(self, message) -> bytes:
         """
@@ -228,13 +521,11 @@ class TuziProvider(ImageProvider):
             ValueError: 内容审核拒绝
             RuntimeError: 图片提取失败
         """
-        message_dict = message.model_dump()
-
         # Step 0: 优先检查 multi_mod_content 字段（tuzi 非标准扩展）
         # 某些 API Key 会返回此格式，包含 inline_data Base64 图片
-        if 'multi_mod_content' in message_dict:
+        mmc = getattr(message, 'multi_mod_content', None)
+        if mmc:
             log_provider_message('tuzi', "检测到 multi_mod_content 字段")
-            mmc = message_dict['multi_mod_content']
 
             if isinstance(mmc, list) and len(mmc) > 0:
                 for i, item in enumerate(mmc):
@@ -261,37 +552,59 @@ class TuziProvider(ImageProvider):
                                 log_provider_message('tuzi',
                                     f"multi_mod_content[{i}] Base64 解码失败: {e}", "WARNING")
 
-        # Step 1: Deep Search（次优先级，用于处理旧格式）
+        # Step 1a: content 字符串快路径（最常见的成功形态）
+        # 大段 content 只扫描这一次；后面的 Deep Search 不再包含它，
+        # 避免同一段多 KB 文本被重复遍历
+        content = getattr(message, 'content', None)
+        if isinstance(content, str) and content:
+            image_bytes = self._find_image_in_payload(content)
+            if image_bytes and self._is_valid_image(image_bytes):
+                log_provider_message('tuzi', f"content 快路径提取成功: {len(image_bytes)}字节")
+                return image_bytes
+
+        # Step 1b: Deep Search（次优先级，用于处理旧格式）
+        # content 已在快路径扫描过，multi_mod_content 已由 Step 0 处理过
+        # （存在但未产出图片时重扫也不会有结果），均从载荷中剔除；
+        # pydantic 模型按字段惰性取值，不提前 model_dump 整棵模型。
+        # SDK 模型是 extra="allow"：tuzi 的非标准字段（images 等）
+        # 不在 model_fields 里，必须并入 __pydantic_extra__
+        scanned_keys = {'content', 'multi_mod_content'} if mmc else {'content'}
         log_provider_message('tuzi', "开始 Deep Search 递归搜索...")
-        image_bytes = self._find_image_in_payload(message_dict)
+        if hasattr(type(message), 'model_fields'):
+            payload = {name: getattr(message, name, None)
+                       for name in type(message).model_fields
+                       if name not in scanned_keys}
+            extra = getattr(message, '__pydantic_extra__', None)
+            if extra:
+                payload.update((key, value) for key, value in extra.items()
+                               if key not in scanned_keys)
+        else:
+            payload = {key: value for key, value in message.model_dump().items()
+                       if key not in scanned_keys}
+        image_bytes = self._find_image_in_payload(payload)
         if image_bytes and self._is_valid_image(image_bytes):
             log_provider_message('tuzi', f"Deep Search 成功: {len(image_bytes)}字节")
             return image_bytes
 
         # Step 2: 检查内容审核拒绝
-        if hasattr(message, 'refusal') and message.refusal:
-            log_error('内容审核拒绝', message.refusal,
-                     f"完整信息: {message.refusal}")
-            raise ValueError(f"模型拒绝生成: {message.refusal}")
-
-        # Step 3: 检查 content 字段中的拒绝关键词
-        if hasattr(message, 'content') and message.content:
-            self._check_content_refusal(message.content)
-
-        # Step 4: 检查是否有内容但提取失败（软拒绝检测）
-        if hasattr(message, 'content') and message.content:
-            content_lower = message.content.lower()
-            soft_refusal_keywords = [
-                "sorry", "cannot", "can't", "unable to",
-                "don't", "won't", "inappropriate",
-                "against", "policy", "guidelines"
-            ]
-
-            for keyword in soft_refusal_keywords:
-                if keyword in content_lower:
-                    log_error('隐式内容拒绝', keyword,
-                             f"内容前200字符: {message.content[:200]}")
-                    raise ValueError(f"模型隐式拒绝（包含关键词'{keyword}'）: {message.content[:100]}")
+        refusal = getattr(message, 'refusal', None)
+        if refusal:
+            log_error('内容审核拒绝', refusal,
+                     f"完整信息: {refusal}")
+            raise ValueError(f"模型拒绝生成: {refusal}")
+
+        # Step 3/4: 拒绝关键词检测（复用 Step 1a 已解析的 content 局部变量，
+        # 不再重复 hasattr + 属性读取）
+        if isinstance(content, str) and content:
+            self._check_content_refusal(content)
+
+            # 软拒绝检测（响应有内容但提取失败）
+            match = _SOFT_REFUSAL_RE.search(content)
+            if match:
+                keyword = match.group().lower()
+                log_error('隐式内容拒绝', keyword,
+                         f"内容前200字符: {content[:200]}")
+                raise ValueError(f"模型隐式拒绝（包含关键词'{keyword}'）: {content[:100]}")
 
         # Step 5: 所有方法失败（响应有内容但无图片，通常是内容问题）
         log_error('图片提取失败', '所有提取方法均失败',
@@ -308,35 +621,20 @@ class TuziProvider(ImageProvider):
         Raises:
             ValueError: 检测到内容审核拒绝
         """
-        refusal_keywords = [
-            # 英文关键词（通用）
-            "sorry", "cannot", "can't", "unable to",
-            "don't", "won't", "inappropriate",
-            "against our policy", "violates", "prohibited",
-
-            # 平台特定关键词
-            "blocked by Google Gemini",
-            "PROHIBITED_CONTENT",
-            "SAFETY",
-            "blocked by policy",
-            "content is prohibited",
-            "violates our content policy",
-
-            # 中文关键词
-            "抱歉", "无法", "不能", "不符合",
-            "违反", "禁止", "政策"
-        ]
-
-        content_lower = content.lower()
-        for keyword in refusal_keywords:
-            if keyword.lower() in content_lower:
-                log_error('内容审核拒绝', keyword,
-                         f"内容前200字符: {content[:200]}")
-                raise ValueError(f"内容审核拒绝: {keyword}")
+        match = _REFUSAL_RE.search(content)
+        if match:
+            keyword = match.group().lower()
+            log_error('内容审核拒绝', keyword,
+                     f"内容前200字符: {content[:200]}")
+            raise ValueError(f"内容审核拒绝: {keyword}")
 
     def _find_image_in_payload(self, data) -> bytes:
         """
-        Deep Search: 递归搜索响应数据中的图片数据
+        Deep Search: 迭代搜索响应数据中的图片数据
+
+        使用显式 deque 工作队列代替递归：不再为每个节点分配 Python 栈帧，
+        深层嵌套响应也不会触发 RecursionError；每个 dict 只遍历一次，
+        优先级字段（b64_json/tool_calls/url）先于普通字段处理
 
         支持格式：
         - Markdown: ![alt](https://...)
@@ -350,110 +648,206 @@ class TuziProvider(ImageProvider):
         Returns:
             bytes: 图片二进制数据，未找到返回 None
         """
-        # 快速路径：优先检查常见的结构化图片字段
-        if isinstance(data, dict):
-            # Priority 1: 检查 b64_json
-            if 'b64_json' in data and isinstance(data['b64_json'], str):
-                log_provider_message('tuzi', "Deep Search: 找到 'b64_json' 字段")
-                image_bytes = self._safe_base64_decode(data['b64_json'])
-                if image_bytes and self._is_valid_image(image_bytes):
-                    return image_bytes
-
-            # Priority 2: 检查 tool_calls
-            if 'tool_calls' in data and data['tool_calls']:
-                log_provider_message('tuzi', "Deep Search: 找到 'tool_calls' 字段")
-                result = self._find_image_in_payload(data['tool_calls'])
-                if result:
-                    return result
-
-            # Priority 3: 检查 url 字段（HTTP 下载）
-            if 'url' in data and isinstance(data['url'], str):
-                url = data['url']
-                if url.startswith('http') and re.search(r'\.(png|jpg|jpeg|webp|gif)($|\?)', url, re.IGNORECASE):
-                    log_provider_message('tuzi', f"Deep Search: 找到图片 URL: {url[:80]}")
-                    image_bytes = self._download_image(url)
-                    if image_bytes:
+        queue = deque([data])
+        # 发现的 HTTP 图片 URL 先收集：整树扫描完没有内联数据时
+        # 再统一并行下载，内联 base64 存在时完全不触网
+        pending_urls = []
+
+        while queue:
+            node = queue.popleft()
+
+            # 响应载荷中的容器都是精确的 dict/list/str（json 反序列化或
+            # model_dump 产物），type() 身份比较替代 isinstance 的
+            # 继承链查找，每个节点省三次类型遍历
+            node_type = type(node)
+
+            if node_type is dict:
+                # Priority 1: 检查 b64_json
+                b64_json = node.get('b64_json')
+                if isinstance(b64_json, str):
+                    log_provider_message('tuzi', "Deep Search: 找到 'b64_json' 字段")
+                    image_bytes = self._safe_base64_decode(b64_json)
+                    if image_bytes and self._is_valid_image(image_bytes):
                         return image_bytes
 
-        # 处理字典：递归遍历（跳过黑名单）
-        if isinstance(data, dict):
-            BLACKLIST_KEYS = {
-                'reasoning', 'reasoning_details',
-                'usage', 'prompt_tokens_details',
-                'annotations'
-            }
-
-            for key, value in data.items():
-                if key in BLACKLIST_KEYS:
-                    log_provider_message('tuzi', f"Deep Search: 跳过黑名单字段 '{key}'")
-                    continue
-                result = self._find_image_in_payload(value)
-                if result:
-                    return result
-
-        # 处理列表
-        elif isinstance(data, list):
-            for item in data:
-                result = self._find_image_in_payload(item)
-                if result:
-                    return result
+                # Priority 2: 检查 tool_calls（插队到队首优先处理）
+                tool_calls = node.get('tool_calls')
+                if tool_calls:
+                    log_provider_message('tuzi', "Deep Search: 找到 'tool_calls' 字段")
+                    queue.appendleft(tool_calls)
+
+                # Priority 3: 检查 url 字段（HTTP 收集统一下载，data URL 就地解码）
+                url = node.get('url')
+                if isinstance(url, str):
+                    if url.startswith('http') and _URL_EXT_RE.search(url):
+                        log_provider_message('tuzi', f"Deep Search: 找到图片 URL: {url[:80]}")
+                        pending_urls.append(url)
+                    elif url.startswith('data:image'):
+                        image_bytes = self._extract_image_from_string(url, pending_urls)
+                        if image_bytes:
+                            return image_bytes
 
-        # 处理字符串
-        elif isinstance(data, str):
-            # Target 1: Markdown 图片链接（Tuzi 特色，最高优先级）
-            # 支持两种格式：
-            # - ![alt](https://example.com/image.png)  ← Default分组
-            # - ![alt](data:image/jpeg;base64,...)     ← Gemini原价分组
-            markdown_pattern = r'!\[.*?\]\(([^)]+)\)'  # 捕获括号内所有内容
-            match = re.search(markdown_pattern, data)
-            if match:
-                url = match.group(1).strip()  # 提取括号内容并去除空格
+                # 其余字段排到队尾（跳过黑名单与已处理的优先级字段）
+                for key, value in node.items():
+                    if key in _BLACKLIST_KEYS:
+                        log_provider_message('tuzi', f"Deep Search: 跳过黑名单字段 '{key}'")
+                        continue
+                    if key in _PRIORITY_KEYS:
+                        continue
+                    queue.append(value)
+
+            elif node_type is list:
+                queue.extend(node)
+
+            elif node_type is str:
+                image_bytes = self._extract_image_from_string(node, pending_urls)
+                if image_bytes:
+                    return image_bytes
 
-                # 情况1：HTTP/HTTPS URL（下载）
-                if url.startswith('http://') or url.startswith('https://'):
-                    log_provider_message('tuzi', f"Deep Search: 找到 Markdown HTTP 链接: {url[:80]}")
-                    image_bytes = self._download_image(url)
-                    if image_bytes:
+            # pydantic 模型：按字段名惰性取值，黑名单字段连取值都跳过，
+            # 避免 model_dump 把大段 reasoning 等一次性物化成 dict
+            elif hasattr(node_type, 'model_fields'):
+                # 与 dict 分支相同的优先级处理
+                b64_json = getattr(node, 'b64_json', None)
+                if isinstance(b64_json, str):
+                    log_provider_message('tuzi', "Deep Search: 找到 'b64_json' 字段")
+                    image_bytes = self._safe_base64_decode(b64_json)
+                    if image_bytes and self._is_valid_image(image_bytes):
                         return image_bytes
 
-                # 情况2：Data URL（Base64解码）
-                elif url.startswith('data:image'):
-                    log_provider_message('tuzi', f"Deep Search: 找到 Markdown Data URL (len={len(url)})")
-                    # 提取 base64 数据部分：data:image/jpeg;base64,<data>
-                    data_url_match = re.search(r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)', url)
-                    if data_url_match:
-                        base64_data = data_url_match.group(1)
-                        image_bytes = self._safe_base64_decode(base64_data)
-                        if image_bytes and self._is_valid_image(image_bytes):
-                            log_provider_message('tuzi', f"Deep Search: Markdown Data URL 解码成功: {len(image_bytes)}字节")
+                url = getattr(node, 'url', None)
+                if isinstance(url, str):
+                    if url.startswith('http') and _URL_EXT_RE.search(url):
+                        log_provider_message('tuzi', f"Deep Search: 找到图片 URL: {url[:80]}")
+                        pending_urls.append(url)
+                    elif url.startswith('data:image'):
+                        image_bytes = self._extract_image_from_string(url, pending_urls)
+                        if image_bytes:
                             return image_bytes
-                        else:
-                            log_provider_message('tuzi', "Deep Search: Markdown Data URL 解码后验证失败", "WARNING")
-
-            # Target 2: data:image 开头的 Data URL
-            if data.startswith('data:image'):
-                log_provider_message('tuzi', "Deep Search: 找到 data:image URL")
-                match = re.search(r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)', data)
-                if match:
-                    image_bytes = self._safe_base64_decode(match.group(1))
-                    if image_bytes:
-                        return image_bytes
 
-            # Target 3: 疑似 Raw Base64（长度 >5000 且不含空格）
-            elif len(data) > 5000 and ' ' not in data:
-                log_provider_message('tuzi', f"Deep Search: 检测到疑似 Raw Base64 (len={len(data)})")
-                image_bytes = self._safe_base64_decode(data)
-                # 验证解码结果是否为有效图片（文件头魔数校验）
-                if image_bytes and self._is_valid_image(image_bytes):
-                    log_provider_message('tuzi', f"Deep Search: Raw Base64 解码并验证成功: {len(image_bytes)}字节")
+                for name in node_type.model_fields:
+                    if name in _BLACKLIST_KEYS or name in ('b64_json', 'url'):
+                        continue
+                    value = getattr(node, name, None)
+                    if value is not None:
+                        queue.append(value)
+
+                # extra="allow" 的模型：动态字段在 __pydantic_extra__ 里，
+                # 不在 model_fields 中，同样入队
+                extra = getattr(node, '__pydantic_extra__', None)
+                if extra:
+                    for name, value in extra.items():
+                        if name in _BLACKLIST_KEYS or name in ('b64_json', 'url'):
+                            continue
+                        if value is not None:
+                            queue.append(value)
+
+        # 没有内联数据，下载收集到的 URL（多个时并行，省去串行往返之和）
+        if pending_urls:
+            # dict.fromkeys 去重：C 级单次调用且保持发现顺序，
+            # 同一 URL 在载荷中反复出现时只下载一次
+            pending_urls = list(dict.fromkeys(pending_urls))
+            if len(pending_urls) == 1:
+                return self._download_image(pending_urls[0])
+            # 首个成功即返回：按完成顺序消费，不等慢的/失败的候选，
+            # 剩余未启动的任务直接取消
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(self._download_image, url)
+                           for url in pending_urls]
+                try:
+                    for future in as_completed(futures):
+                        image_bytes = future.result()
+                        if image_bytes:
+                            return image_bytes
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        return None
+
+    def _extract_image_from_string(self, data: str, pending_urls: list) -> bytes:
+        """
+        Deep Search 字符串目标提取（Markdown / data URL / Raw Base64）
+
+        Args:
+            data: 候选字符串
+            pending_urls: 发现的 HTTP 图片 URL 收集列表（由调用方统一下载）
+
+        Returns:
+            bytes: 内联图片二进制数据，未命中返回 None
+        """
+        # Target 1: Markdown 图片链接（Tuzi 特色，最高优先级）
+        # 支持两种格式：
+        # - ![alt](https://example.com/image.png)  ← Default分组
+        # - ![alt](data:image/jpeg;base64,...)     ← Gemini原价分组
+        # 哨兵预检：先用 str.find 定位 '![' 字面量（C 级 memmem 扫描），
+        # 不含该哨兵的字符串连正则引擎都不必启动；命中时让正则
+        # 直接从哨兵位置开始匹配，避免重扫前面的内容
+        md_idx = data.find('![')
+        match = _MD_IMG_RE.search(data, md_idx) if md_idx != -1 else None
+        if match:
+            url = match.group(1).strip()  # 提取括号内容并去除空格
+
+            # 情况1：HTTP/HTTPS URL（收集，优先继续找内联数据）
+            if url.startswith('http://') or url.startswith('https://'):
+                log_provider_message('tuzi', f"Deep Search: 找到 Markdown HTTP 链接: {url[:80]}")
+                pending_urls.append(url)
+
+            # 情况2：Data URL（Base64解码）
+            elif url.startswith('data:image'):
+                log_provider_message('tuzi', f"Deep Search: 找到 Markdown Data URL (len={len(url)})")
+                # 前缀已确认，定位 ';base64,' 后直接切片：
+                # 不必让正则引擎重扫整个（可能多 MB 的）URL
+                idx = url.find(';base64,')
+                if idx != -1:
+                    image_bytes = self._safe_base64_decode(url[idx + 8:])
+                    if image_bytes and self._is_valid_image(image_bytes):
+                        log_provider_message('tuzi', f"Deep Search: Markdown Data URL 解码成功: {len(image_bytes)}字节")
+                        return image_bytes
+                    else:
+                        log_provider_message('tuzi', "Deep Search: Markdown Data URL 解码后验证失败", "WARNING")
+
+        # Target 2: data:image 开头的 Data URL（同样用 find + 切片代替正则）
+        if data.startswith('data:image'):
+            log_provider_message('tuzi', "Deep Search: 找到 data:image URL")
+            idx = data.find(';base64,')
+            if idx != -1:
+                image_bytes = self._safe_base64_decode(data[idx + 8:])
+                if image_bytes:
                     return image_bytes
-                else:
-                    log_provider_message('tuzi', "Deep Search: Raw Base64 解码后文件头验证失败，跳过", "WARNING")
+
+        # Target 3: 疑似 Raw Base64（长度 >5000 且不含空格）
+        elif len(data) > 5000 and ' ' not in data:
+            # 前缀预检：base64 前缀与字节前缀一一对应，不以已知图片格式
+            # 的 base64 前缀开头的长字符串（reasoning/HTML 等）直接跳过，
+            # 连头部的 24 字节解码都省掉
+            if not data.startswith(_B64_IMAGE_PREFIXES):
+                log_provider_message('tuzi',
+                    "Deep Search: Raw Base64 前缀预检失败，跳过", "DEBUG")
+                return None
+            log_provider_message('tuzi', f"Deep Search: 检测到疑似 Raw Base64 (len={len(data)})")
+            image_bytes = self._safe_base64_decode(data)
+            # 验证解码结果是否为有效图片（文件头魔数校验）
+            if image_bytes and self._is_valid_image(image_bytes):
+                log_provider_message('tuzi', f"Deep Search: Raw Base64 解码并验证成功: {len(image_bytes)}字节")
+                return image_bytes
+            else:
+                log_provider_message('tuzi', "Deep Search: Raw Base64 解码后文件头验证失败，跳过", "WARNING")
 
         return None
 
     # ==================== 辅助方法（从 OpenRouter 移植）====================
 
+    def _has_long_string(self, data) -> bool:
+        """检查数据中是否存在需要截断的长字符串（只读遍历，不分配新容器）"""
+        if isinstance(data, str):
+            return len(data) > 500
+        if isinstance(data, dict):
+            return any(self._has_long_string(value) for value in data.values())
+        if isinstance(data, list):
+            return any(self._has_long_string(item) for item in data)
+        return False
+
     def _truncate_logs(self, data):
         """
         递归截断字典中的长字符串，避免日志刷屏
@@ -464,6 +858,9 @@ class TuziProvider(ImageProvider):
         Returns:
             处理后的数据（超过500字符的字符串被截断）
         """
+        # 无长字符串时直接返回原对象：只读检查代替整树深拷贝
+        if not self._has_long_string(data):
+            return data
         if isinstance(data, dict):
             return {key: self._truncate_logs(value) for key, value in data.items()}
         elif isinstance(data, list):
@@ -488,28 +885,35 @@ class TuziProvider(ImageProvider):
         if not data or len(data) < 8:
             return False
 
-        # 检查常见图片格式的魔数（文件头）
-        # PNG: \x89PNG
-        if data[:4] == b'\x89PNG':
-            log_provider_message('tuzi', "文件头验证: PNG 格式")
+        # 前 8 字节打包成一个 int 做掩码比较：每种格式一次整数运算，
+        # 不再为每个候选构造多个短 bytes 切片
+        head = int.from_bytes(data[:8], 'big')
+
+        # PNG: \x89PNG\r\n\x1a\n（完整 8 字节签名）
+        if head == _PNG_SIG:
+            log_provider_message('tuzi', "文件头验证: PNG 格式", "DEBUG")
             return True
 
         # JPEG: \xff\xd8\xff
-        if data[:3] == b'\xff\xd8\xff':
-            log_provider_message('tuzi', "文件头验证: JPEG 格式")
+        if head & _JPEG_MASK == _JPEG_SIG:
+            log_provider_message('tuzi', "文件头验证: JPEG 格式", "DEBUG")
             return True
 
-        # WEBP: RIFF....WEBP
-        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
-            log_provider_message('tuzi', "文件头验证: WEBP 格式")
+        # GIF: GIF87a 或 GIF89a
+        masked = head & _GIF_MASK
+        if masked == _GIF87_SIG or masked == _GIF89_SIG:
+            log_provider_message('tuzi', "文件头验证: GIF 格式", "DEBUG")
             return True
 
-        # GIF: GIF87a 或 GIF89a
-        if data[:6] in (b'GIF87a', b'GIF89a'):
-            log_provider_message('tuzi', "文件头验证: GIF 格式")
+        # WEBP: RIFF....WEBP（字节 8-11 用索引比较，返回 int 无分配）
+        if head & _RIFF_MASK == _RIFF_SIG and len(data) >= 12 \
+                and data[8] == 0x57 and data[9] == 0x45 \
+                and data[10] == 0x42 and data[11] == 0x50:
+            log_provider_message('tuzi', "文件头验证: WEBP 格式", "DEBUG")
             return True
 
-        log_provider_message('tuzi', f"文件头验证失败: 前8字节 = {data[:8]}", "WARNING")
+        log_provider_message('tuzi', "文件头验证失败: 前8字节 = %s", "DEBUG",
+                             lambda: data[:8])
         return False
 
     def _download_image(self, url: str) -> bytes:
@@ -522,17 +926,50 @@ class TuziProvider(ImageProvider):
         Returns:
             bytes: 图片二进制数据，失败返回 None
         """
+        if url in self._url_cache:
+            log_provider_message('tuzi', f"图片 URL 命中缓存: {url[:80]}")
+            return self._url_cache[url]
+
+        result = None
         try:
             log_provider_message('tuzi', f"开始下载图片: {url[:80]}...")
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                log_image_operation("URL下载成功", f"从URL成功下载: {len(response.content)}字节")
-                return response.content
-            else:
-                log_error('HTTP错误', f"状态码 {response.status_code}", f"URL: {url[:80]}")
+            with self._session.get(url, timeout=10, stream=True) as response:
+                if response.status_code == 200:
+                    # 读取响应体之前先校验头部：HTML 错误页或超大文件
+                    # 直接放弃，不浪费带宽和内存
+                    content_type = response.headers.get('Content-Type', '')
+                    if content_type and not (
+                            content_type.startswith('image/')
+                            or content_type.startswith('application/octet-stream')):
+                        log_error('下载图片失败',
+                                  f"Content-Type 不是图片: {content_type}",
+                                  f"URL: {url[:80]}")
+                    elif int(response.headers.get('Content-Length') or 0) > _MAX_DOWNLOAD_BYTES:
+                        log_error('下载图片失败',
+                                  f"文件过大: {response.headers['Content-Length']}字节",
+                                  f"URL: {url[:80]}")
+                    else:
+                        # 分块读入 bytearray：网络等待与拷贝重叠，
+                        # 不构建中间字符串；边读边检查大小上限，
+                        # 防止未声明 Content-Length 的超大响应耗尽内存
+                        buf = bytearray()
+                        for chunk in response.iter_content(chunk_size=65536):
+                            buf.extend(chunk)
+                            if len(buf) > _MAX_DOWNLOAD_BYTES:
+                                log_error('下载图片失败',
+                                          f"响应超过大小上限 {_MAX_DOWNLOAD_BYTES}字节",
+                                          f"URL: {url[:80]}")
+                                buf = None
+                                break
+                        if buf is not None:
+                            log_image_operation("URL下载成功", f"从URL成功下载: {len(buf)}字节")
+                            result = bytes(buf)
+                else:
+                    log_error('HTTP错误', f"状态码 {response.status_code}", f"URL: {url[:80]}")
         except Exception as e:
             log_error('下载图片失败', str(e), f"URL: {url[:80]}")
-        return None
+        self._url_cache[url] = result
+        return result
 
     def _safe_base64_decode(self, data_str: str) -> bytes:
         """
@@ -546,12 +983,29 @@ class TuziProvider(ImageProvider):
         """
         try:
             data_str = data_str.strip()
-            # 确保正确的padding
-            missing_padding = len(data_str) % 4
-            if missing_padding:
-                data_str += '=' * (4 - missing_padding)
-            decoded = base64.b64decode(data_str)
-            return decoded
+            # 规模与字符集防线：区间外的长度解不出有效图片或代价过大，
+            # 含非 ASCII 字符的串必定不是 base64，都在分配输出缓冲前拒绝
+            if not (_MIN_B64_LENGTH <= len(data_str) <= _MAX_B64_LENGTH):
+                return None
+            if not data_str.isascii():
+                return None
+            # pybase64 可用时走 SIMD 解码（需补齐 padding）；
+            # 否则 a2b_base64（b64decode 底层的 C 实现）strict_mode=False
+            # 容忍缺失 padding，省去 len%4 计算和补 '=' 的整串拷贝
+            if _b64 is not base64:
+                # validate=True 让 pybase64 走 SIMD 快路径（validate=False
+                # 会退回逐字符过滤的慢路径），代价是不容忍内嵌空白
+                # （MIME 折行）；失败时 translate 单遍删除全部空白、
+                # 基于清洗后的长度重新补 padding 再重试一次
+                try:
+                    padded = data_str + '=' * (-len(data_str) % 4)
+                    return _b64.b64decode(padded, validate=True)
+                except Exception:
+                    cleaned = data_str.translate(_WS_DELETE_TABLE)
+                    cleaned += '=' * (-len(cleaned) % 4)
+                    return _b64.b64decode(cleaned, validate=True)
+            # a2b_base64 非严格模式本身跳过空白字符，无需预清洗
+            return a2b_base64(data_str, strict_mode=False)
         except Exception as e:
             log_error('base64解码错误', str(e), f"数据前50字符: {data_str[:50]}")
             return None
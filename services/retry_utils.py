@@ -8,14 +8,18 @@
 from tenacity import (
     retry,
     stop_after_attempt,
-    wait_exponential,
+    wait_exponential_jitter,
     retry_if_exception,
     before_sleep_log,
     after_log
 )
 import logging
+import re
 from typing import Callable
 
+import openai
+import requests
+
 # 导入现有日志系统
 from .logging_config import log_provider_message, log_error
 
@@ -24,6 +28,87 @@ from .logging_config import log_provider_message, log_error
 # 错误检测函数
 # ============================================================================
 
+# 各类错误关键词（按优先级排列：Rate Limit > 网络 > 临时服务故障）
+_RATE_LIMIT_KEYWORDS = (
+    '429',  # HTTP 状态码
+    'too many requests',
+    'rate limit',
+    'rate_limit_exceeded',
+    'quota exceeded',
+    'throttled',
+    'resource exhausted'
+)
+
+_NETWORK_KEYWORDS = (
+    'timeout',
+    'timed out',
+    'connection error',
+    'connection refused',
+    'network error',
+    'temporary failure'
+)
+
+_TEMPORARY_KEYWORDS = (
+    '502',
+    '503',
+    '504',
+    'bad gateway',
+    'service unavailable',
+    'gateway timeout',
+    'internal server error'  # 某些情况下 500 也可能是临时的
+)
+
+_NON_RETRYABLE_KEYWORDS = (
+    '400',  # Bad Request
+    '401',  # Unauthorized
+    '403',  # Forbidden
+    '404',  # Not Found
+    'invalid api key',
+    'authentication failed',
+    'refusal',  # 内容审核拒绝
+    'prohibited',
+    'blocked by policy',
+    'invalid request'
+)
+
+# 关键词 -> 日志分类标签（命中后反查，保留原有的分类日志）
+_KEYWORD_CATEGORY = {}
+for _keywords, _label in ((_RATE_LIMIT_KEYWORDS, 'Rate Limit 错误'),
+                          (_NETWORK_KEYWORDS, '网络错误'),
+                          (_TEMPORARY_KEYWORDS, '临时服务故障')):
+    for _keyword in _keywords:
+        _KEYWORD_CATEGORY[_keyword] = _label
+
+# 预编译成单个交替正则：对错误消息做一次 C 级线性扫描，
+# 代替最多 ~20 次 Python 层的 in 子串查找（每次都是全量扫描）
+_RETRYABLE_RE = re.compile(
+    '|'.join(map(re.escape,
+                 _RATE_LIMIT_KEYWORDS + _NETWORK_KEYWORDS + _TEMPORARY_KEYWORDS)),
+    re.IGNORECASE)
+_NON_RETRYABLE_RE = re.compile(
+    '|'.join(map(re.escape, _NON_RETRYABLE_KEYWORDS)), re.IGNORECASE)
+
+# 关键词扫描的消息长度上限：OpenAI SDK 异常常内嵌整个响应体，
+# 判定所需的状态码/关键词都在开头，没必要整段扫描
+_SCAN_LIMIT = 512
+
+# 异常类型快路径：类型本身已足够判定时，完全跳过字符串扫描
+# （APIConnectionError 覆盖 APITimeoutError 子类）
+_RETRYABLE_TYPES = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError
+)
+
+_NON_RETRYABLE_TYPES = (
+    openai.AuthenticationError,
+    openai.PermissionDeniedError,
+    openai.BadRequestError,
+    openai.NotFoundError
+)
+
+
 def is_retryable_error(exception: Exception) -> bool:
     """
     判断异常是否应该重试
@@ -46,104 +131,82 @@ def is_retryable_error(exception: Exception) -> bool:
     Returns:
         bool: True 表示应该重试，False 表示立即失败
     """
-    error_str = str(exception).lower()
     error_type = type(exception).__name__
 
-    # 1. Rate Limit 错误（最高优先级）
-    rate_limit_indicators = [
-        '429',  # HTTP 状态码
-        'too many requests',
-        'rate limit',
-        'rate_limit_exceeded',
-        'quota exceeded',
-        'throttled',
-        'resource exhausted'
-    ]
-
-    for indicator in rate_limit_indicators:
-        if indicator in error_str:
-            log_provider_message(
-                'retry_utils',
-                f"检测到 Rate Limit 错误: {error_type} - {str(exception)[:200]}",
-                "WARNING"
-            )
-            return True
+    # 0. 异常类型快路径：SDK 类型化异常直接判定，
+    #    不必 str() 整个（可能带大响应体的）异常再扫关键词
+    if isinstance(exception, _RETRYABLE_TYPES):
+        log_provider_message(
+            'retry_utils',
+            f"检测到可重试异常类型: {error_type} - {str(exception)[:200]}",
+            "WARNING"
+        )
+        return True
+
+    if isinstance(exception, _NON_RETRYABLE_TYPES):
+        log_provider_message(
+            'retry_utils',
+            f"检测到不可重试异常类型: {error_type} - {str(exception)[:200]}",
+            "ERROR"
+        )
+        return False
 
-    # 2. 网络超时/连接错误
-    network_errors = [
-        'timeout',
-        'timed out',
-        'connection error',
-        'connection refused',
-        'network error',
-        'temporary failure'
-    ]
-
-    for error_keyword in network_errors:
-        if error_keyword in error_str:
+    # 0b. 带 status_code 属性的异常按状态码判定
+    status_code = getattr(exception, 'status_code', None)
+    if isinstance(status_code, int):
+        if status_code == 429 or status_code >= 500:
             log_provider_message(
                 'retry_utils',
-                f"检测到网络错误: {error_type} - {str(exception)[:200]}",
+                f"检测到可重试状态码 {status_code}: {error_type}",
                 "WARNING"
             )
             return True
-
-    # 3. 临时服务故障 (HTTP 502/503/504)
-    temporary_errors = [
-        '502',
-        '503',
-        '504',
-        'bad gateway',
-        'service unavailable',
-        'gateway timeout',
-        'internal server error'  # 某些情况下 500 也可能是临时的
-    ]
-
-    for error_keyword in temporary_errors:
-        if error_keyword in error_str:
+        if 400 <= status_code < 500:
             log_provider_message(
                 'retry_utils',
-                f"检测到临时服务故障: {error_type} - {str(exception)[:200]}",
-                "WARNING"
+                f"检测到不可重试状态码 {status_code}: {error_type}",
+                "ERROR"
             )
-            return True
+            return False
+
+    # 大小写交给 IGNORECASE 正则处理，且只扫描前 _SCAN_LIMIT 字符：
+    # 免去对完整消息的一次 .lower() 拷贝
+    error_text = str(exception)
+    error_str = error_text[:_SCAN_LIMIT]
+
+    # 1-3. 可重试关键词（单次扫描，命中后反查分类标签记日志）
+    match = _RETRYABLE_RE.search(error_str)
+    if match:
+        category = _KEYWORD_CATEGORY[match.group().lower()]
+        log_provider_message(
+            'retry_utils',
+            f"检测到{category}: {error_type} - {error_text[:200]}",
+            "WARNING"
+        )
+        return True
 
     # 4a. 明确排除 ValueError 类型（内容/参数错误，永不重试）
     if isinstance(exception, ValueError):
         log_provider_message(
             'retry_utils',
-            f"检测到 ValueError (内容/参数错误)，不可重试: {str(exception)[:200]}",
+            f"检测到 ValueError (内容/参数错误)，不可重试: {error_text[:200]}",
             "ERROR"
         )
         return False
 
     # 4b. 不可重试的错误（明确排除字符串关键词）
-    non_retryable_indicators = [
-        '400',  # Bad Request
-        '401',  # Unauthorized
-        '403',  # Forbidden
-        '404',  # Not Found
-        'invalid api key',
-        'authentication failed',
-        'refusal',  # 内容审核拒绝
-        'prohibited',
-        'blocked by policy',
-        'invalid request'
-    ]
-
-    for indicator in non_retryable_indicators:
-        if indicator in error_str:
-            log_provider_message(
-                'retry_utils',
-                f"检测到不可重试错误: {error_type} - {str(exception)[:200]}",
-                "ERROR"
-            )
-            return False
+    if _NON_RETRYABLE_RE.search(error_str):
+        log_provider_message(
+            'retry_utils',
+            f"检测到不可重试错误: {error_type} - {error_text[:200]}",
+            "ERROR"
+        )
+        return False
 
     # 5. 默认策略：未知错误不重试（保守策略）
     log_provider_message(
         'retry_utils',
-        f"未知错误类型，不重试: {error_type} - {str(exception)[:200]}",
+        f"未知错误类型，不重试: {error_type} - {error_text[:200]}",
         "WARNING"
     )
     return False
@@ -159,17 +222,20 @@ def common_retry_strategy(func: Callable) -> Callable:
 
     重试配置：
     - 最大重试次数: 5 次
-    - 退避策略: 指数退避 (2^n 秒，最小 2 秒，最大 60 秒)
+    - 退避策略: 带抖动的指数退避 (2^n 秒起步，最大 60 秒，附加 0-2 秒随机抖动)
     - 重试条件: 仅重试可重试的错误 (is_retryable_error)
     - 最终行为: 重新抛出异常 (reraise=True)
 
-    退避时间示例：
+    退避时间示例（不含抖动）：
     - 第 1 次重试: 等待 2 秒
     - 第 2 次重试: 等待 4 秒
     - 第 3 次重试: 等待 8 秒
     - 第 4 次重试: 等待 16 秒
     - 第 5 次重试: 等待 32 秒
 
+    抖动的作用：并发的多个请求同时撞上 429 时，如果都在整 2/4/8 秒
+    醒来会再次同时冲击上游；随机抖动把重试时间错开
+
     Args:
         func: 被装饰的函数
 
@@ -192,8 +258,8 @@ def common_retry_strategy(func: Callable) -> Callable:
         # 停止条件：最多 5 次重试
         stop=stop_after_attempt(5),
 
-        # 等待策略：指数退避
-        wait=wait_exponential(multiplier=1, min=2, max=60),
+        # 等待策略：带抖动的指数退避（避免并发重试同时唤醒）
+        wait=wait_exponential_jitter(initial=2, max=60, jitter=2),
 
         # 重新抛出最后的异常
         reraise=True,
@@ -228,6 +294,50 @@ def common_retry_strategy(func: Callable) -> Callable:
     return wrapper
 
 
+def common_async_retry_strategy(func: Callable) -> Callable:
+    """
+    common_retry_strategy 的异步版本
+
+    重试配置与同步版完全一致（5 次、带抖动的指数退避 2-60 秒、仅重试可重试错误），
+    供 async 协程形式的 API 调用使用（tenacity 对协程函数自动使用 AsyncRetrying）
+
+    Args:
+        func: 被装饰的协程函数
+
+    Returns:
+        Callable: 装饰后的协程函数
+    """
+    retry_logger = logging.getLogger('retry_strategy')
+
+    @retry(
+        retry=retry_if_exception(is_retryable_error),
+        stop=stop_after_attempt(5),
+        wait=wait_exponential_jitter(initial=2, max=60, jitter=2),
+        reraise=True,
+        before_sleep=before_sleep_log(retry_logger, logging.WARNING),
+        after=after_log(retry_logger, logging.INFO)
+    )
+    async def wrapper(*args, **kwargs):
+        func_name = func.__name__
+        log_provider_message(
+            'retry_utils',
+            f"执行 {func_name}，已启用重试保护",
+            "INFO"
+        )
+
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            log_error(
+                '重试全部失败',
+                f"{func_name} 在 5 次重试后仍然失败",
+                f"错误: {str(e)[:200]}"
+            )
+            raise
+
+    return wrapper
+
+
 # ============================================================================
 # 辅助函数：手动重试逻辑（备用）
 # ============================================================================
@@ -267,25 +377,26 @@ def retry_with_backoff(
             except Exception as e:
                 attempt += 1
 
-                # 检查是否应该重试
-                if not is_retryable_error(e):
-                    raise
-
-                # 达到最大重试次数
+                # 达到最大重试次数：直接抛出，省掉一次无意义的错误分类扫描
                 if attempt >= max_attempts:
                     log_error(
                         '手动重试失败',
                         f"{func.__name__} 在 {max_attempts} 次尝试后失败",
-                        str(e)
+                        str(e)[:200]
                     )
                     raise
 
-                # 计算延迟时间
+                # 检查是否应该重试
+                if not is_retryable_error(e):
+                    raise
+
+                # 计算延迟时间（惰性 % 格式化，日志被过滤时不做格式化）
                 current_delay = min(delay, max_delay)
                 log_provider_message(
                     'retry_utils',
-                    f"第 {attempt} 次重试失败，等待 {current_delay:.1f} 秒后重试...",
-                    "WARNING"
+                    "第 %d 次重试失败，等待 %.1f 秒后重试...",
+                    "WARNING",
+                    attempt, current_delay
                 )
 
                 time.sleep(current_delay)